@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch command-line tool for running scripted operations on several
+Mesytec MHV-4 units at once.
+
+Operations are read from a batch file (or stdin) one per line:
+
+	<serial> <operation> [arguments...]
+
+where the operation is one of
+
+	set   <channel> <voltage>   set the voltage preset of the channel (V)
+	on    <channel>             turn the channel ON
+	off   <channel>             turn the channel OFF
+	read  <channel>             read the voltage (V) and current (uA)
+	ramp  <channel> <voltage>   ramp the channel slowly to the voltage (V)
+
+Empty lines and everything after '#' are ignored. The whole batch is
+checked first and nothing is run if any line is invalid or any unit is not
+connected. The operations of each unit are run in the given order over one
+connection, while the units are driven in parallel. After a failed
+operation the remaining operations of that unit are skipped (unless
+--keep-going is given). Each result is printed as one JSON line, e.g.
+
+	$ echo "0318132 read 0" | ./mhv4.py
+	{"serial": "0318132", "line": 1, "op": "read", "channel": 0, "voltage": 0.0, "current": 0.0}
+"""
+__author__ = "Joonas Konki"
+__license__ = "MIT, see LICENSE for more details"
+__copyright__ = "2018 Joonas Konki"
+
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from collections import OrderedDict
+
+import mhv4lib
+
+RAMP_VOLTAGE_STEP = 1
+RAMP_WAIT_TIME = 1
+RAMP_SETTLE_STEPS = 10 # extra waits for the channel to reach the ramp target
+
+# operation name -> number of arguments after the channel number
+OPERATIONS = { 'set': 1, 'on': 0, 'off': 0, 'read': 0, 'ramp': 1 }
+
+class BatchError(Exception):
+	pass
+
+def check_voltage(voltage):
+	"""The function raises BatchError if ``voltage`` is not between 0 and
+	the library voltage limit. The polarity is set separately.
+	"""
+	if voltage < 0:
+		raise BatchError('voltage %.1f V is negative, set the polarity instead' % voltage)
+	if voltage > mhv4lib.VOLTAGE_LIMIT:
+		raise BatchError('voltage %.1f V is above the limit of %d V'
+			% (voltage, mhv4lib.VOLTAGE_LIMIT))
+
+def parse_line(line):
+	"""The function parses one line of a batch file and returns a tuple
+	``(serial, op, channel, args)``, or None for an empty or comment line.
+
+	:param line: The line of text to be parsed.
+	"""
+	fields = line.split('#', 1)[0].split()
+	if len(fields) == 0: return None
+	if len(fields) < 3:
+		raise BatchError('expected "<serial> <operation> <channel> ..."')
+
+	serial, op = fields[0], fields[1].lower()
+	if op not in OPERATIONS:
+		raise BatchError('unknown operation "%s"' % fields[1])
+	if len(fields) != 3 + OPERATIONS[op]:
+		raise BatchError('operation "%s" takes %d argument(s) after the channel'
+			% (op, OPERATIONS[op]))
+
+	try:
+		channel = int(fields[2])
+		args = [float(a) for a in fields[3:]]
+	except ValueError as e:
+		raise BatchError(str(e))
+	if channel not in [0,1,2,3,4]:
+		raise BatchError('invalid channel number %d' % channel)
+	if op in ['read', 'ramp'] and channel == 4:
+		raise BatchError('operation "%s" needs a single channel 0-3' % op)
+	if op in ['set', 'ramp'] and args[0] < 0:
+		raise BatchError('voltage %.1f V is negative, set the polarity instead' % args[0])
+	return (serial, op, channel, args)
+
+def parse_batch(lines):
+	"""The function parses the lines of a batch and returns a tuple
+	``(jobs, errors)``. ``jobs`` maps each serial number to its list of
+	``(lineno, op, channel, args)`` in the original order, ``errors``
+	is a list of result dictionaries for the lines that could not be parsed.
+
+	:param lines: An iterable of lines, e.g. an open file.
+	"""
+	jobs = OrderedDict()
+	errors = []
+	for lineno, line in enumerate(lines, 1):
+		try:
+			parsed = parse_line(line)
+		except BatchError as e:
+			errors.append({ 'line': lineno, 'error': str(e) })
+			continue
+		if parsed is None: continue
+		serial, op, channel, args = parsed
+		jobs.setdefault(serial, []).append( (lineno, op, channel, args) )
+	return jobs, errors
+
+def find_ports(serials):
+	"""The function looks up the USB serial ports of the MHV-4 units with the
+	given serial numbers and returns a dictionary serial -> port device.
+	"""
+	from serial.tools import list_ports
+
+	ports = {}
+	for port in list_ports.comports():
+		if port.serial_number in serials:
+			ports[port.serial_number] = port.device
+	return ports
+
+def ramp_voltage(mhv4, channel, voltage, step=RAMP_VOLTAGE_STEP, wait=RAMP_WAIT_TIME):
+	"""The function ramps the voltage preset of the given ``channel`` slowly
+	from its current value to ``voltage`` in steps of ``step`` Volts, waiting
+	``wait`` seconds after each step. The ramp starts from the measured
+	voltage of an ON channel, and from the voltage preset of an OFF channel
+	(older firmware may not report the preset). Returns the final voltage reading of the
+	channel, which is 0 if the channel is OFF. Raises BatchError if an ON
+	channel does not reach the voltage, e.g. because of its voltage or
+	current limit.
+	"""
+	check_voltage(voltage)
+	if step <= 0:
+		raise BatchError('ramp step %s V must be positive' % step)
+
+	start = abs(mhv4.get_voltage(channel))
+	if start < 0.1: # channel is OFF
+		start = abs(mhv4.get_voltage_preset(channel))
+	nsteps = int(math.ceil(abs(voltage - start) / step))
+	direction = 1 if voltage > start else -1
+	for i in range(1, nsteps):
+		mhv4.set_voltage(channel, start + direction*i*step)
+		time.sleep(wait)
+
+	# Finally after ramping, set the final requested value
+	mhv4.set_voltage(channel, voltage)
+	time.sleep(wait)
+
+	curvoltage = abs(mhv4.get_voltage(channel))
+	if curvoltage < 0.1: return curvoltage # channel is OFF
+	for i in range(RAMP_SETTLE_STEPS):
+		if abs(voltage - curvoltage) <= step: return curvoltage
+		time.sleep(wait)
+		curvoltage = abs(mhv4.get_voltage(channel))
+	raise BatchError('channel stopped at %.1f V instead of %.1f V (voltage or current limit?)'
+		% (curvoltage, voltage))
+
+def run_operation(mhv4, op, channel, args, step=RAMP_VOLTAGE_STEP, wait=RAMP_WAIT_TIME):
+	"""The function runs one operation on a connected unit and returns a
+	dictionary with the results of the operation.
+	"""
+	if op == 'set':
+		check_voltage(args[0])
+		mhv4.set_voltage(channel, args[0])
+		return { 'voltage_preset': args[0] }
+	if op == 'on':
+		mhv4.set_on(channel)
+		return {}
+	if op == 'off':
+		mhv4.set_off(channel)
+		return {}
+	if op == 'read':
+		return { 'voltage': mhv4.get_voltage(channel),
+		         'current': mhv4.get_current(channel) }
+	if op == 'ramp':
+		return { 'voltage_preset': args[0],
+		         'voltage': ramp_voltage(mhv4, channel, args[0], step, wait) }
+	raise BatchError('unknown operation "%s"' % op)
+
+class Output:
+	"""Thread-safe writer of JSON lines."""
+	def __init__(self, stream):
+		self.stream = stream
+		self.lock = threading.Lock()
+		self.failed = False
+
+	def emit(self, result):
+		with self.lock:
+			if 'error' in result: self.failed = True
+			self.stream.write(json.dumps(result) + '\n')
+			self.stream.flush()
+
+def run_unit(serial, port, jobs, output, baud=9600, step=RAMP_VOLTAGE_STEP, wait=RAMP_WAIT_TIME,
+		keep_going=False):
+	"""The function opens one connection to the unit and runs all of its
+	operations in order. The results are written to ``output``. After an
+	error in one operation the remaining operations of the unit are skipped,
+	unless ``keep_going`` is True.
+	"""
+	try:
+		mhv4 = mhv4lib.MHV4(port, baud=baud)
+	except Exception as e:
+		for lineno, op, channel, args in jobs:
+			output.emit({ 'serial': serial, 'line': lineno, 'op': op,
+				'channel': channel, 'error': 'could not open %s: %s' % (port, e) })
+		return
+
+	failed = None
+	try:
+		for lineno, op, channel, args in jobs:
+			result = OrderedDict([ ('serial', serial), ('line', lineno),
+				('op', op), ('channel', channel) ])
+			if failed is not None:
+				result['error'] = 'skipped after the error on line %d' % failed
+				output.emit(result)
+				continue
+			try:
+				result.update( run_operation(mhv4, op, channel, args, step, wait) )
+			except Exception as e:
+				result['error'] = str(e)
+				if not keep_going: failed = lineno
+			output.emit(result)
+	finally:
+		mhv4.close()
+
+def run_batch(lines, output, baud=9600, step=RAMP_VOLTAGE_STEP, wait=RAMP_WAIT_TIME,
+		keep_going=False):
+	"""The function parses a batch and runs it on all of the units in parallel,
+	one thread and one serial port connection per unit. Nothing is run if
+	any line of the batch is invalid or any of the units is not connected.
+	"""
+	jobs, errors = parse_batch(lines)
+	for error in errors:
+		output.emit(error)
+	if errors: return
+
+	ports = find_ports(set(jobs))
+	missing = [serial for serial in jobs if serial not in ports]
+	for serial in missing:
+		for lineno, op, channel, args in jobs[serial]:
+			output.emit({ 'serial': serial, 'line': lineno, 'op': op,
+				'channel': channel, 'error': 'MHV-4 unit is not connected' })
+	if missing: return
+
+	threads = []
+	for serial, unitjobs in jobs.items():
+		thread = threading.Thread( target=run_unit,
+			args=(serial, ports[serial], unitjobs, output, baud, step, wait, keep_going) )
+		thread.start()
+		threads.append(thread)
+
+	for thread in threads:
+		thread.join()
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		description='Run scripted operations on Mesytec MHV-4 units in parallel.')
+	parser.add_argument('batch', nargs='?', default='-',
+		help='batch file with one operation per line (default: stdin)')
+	parser.add_argument('--baud', type=int, default=9600,
+		help='serial port baud rate (default: %(default)s)')
+	parser.add_argument('--ramp-step', type=int, default=RAMP_VOLTAGE_STEP,
+		help='voltage step of the ramp operation in V (default: %(default)s)')
+	parser.add_argument('--ramp-wait', type=float, default=RAMP_WAIT_TIME,
+		help='wait time after each ramp step in s (default: %(default)s)')
+	parser.add_argument('--keep-going', action='store_true',
+		help='run the remaining operations of a unit after one has failed')
+	opts = parser.parse_args(argv)
+	if opts.ramp_step <= 0:
+		parser.error('--ramp-step must be positive')
+
+	output = Output(sys.stdout)
+	if opts.batch == '-':
+		run_batch(sys.stdin, output, opts.baud, opts.ramp_step, opts.ramp_wait,
+			opts.keep_going)
+	else:
+		with open(opts.batch) as f:
+			run_batch(f, output, opts.baud, opts.ramp_step, opts.ramp_wait,
+				opts.keep_going)
+	return 1 if output.failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
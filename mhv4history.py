@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-resolution history store for readings of Mesytec MHV-4 units.
+
+The readings of each unit, channel and quantity (e.g. 'voltage', 'current')
+are kept in a series of fixed size ring buffers: the latest raw samples and
+a number of decimated tiers, where each bucket holds the min, max and mean
+of the samples in its time interval. The memory use is bounded by the
+capacities of the buffers, and a query for any time window returns at most
+about ``max_points`` points from the finest tier that covers the window.
+"""
+__author__ = "Joonas Konki"
+__license__ = "MIT, see LICENSE for more details"
+__copyright__ = "2018 Joonas Konki"
+
+import math
+import time
+import numbers
+import threading
+
+RAW_CAPACITY = 3600 # latest raw samples kept for each series
+
+# Decimated tiers as (bucket width in s, number of buckets), finest first.
+# The defaults keep 1 day at 10 s, 1 week at 1 min and 60 days at 10 min.
+TIERS = [ (10, 8640), (60, 10080), (600, 8640) ]
+
+class RingBuffer:
+	"""Fixed size buffer of time-ordered tuples, the oldest entries are
+	overwritten when the buffer is full. The first element of each tuple
+	is its timestamp.
+	"""
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.data = [None] * capacity
+		self.start = 0
+		self.size = 0
+
+	def __len__(self):
+		return self.size
+
+	def __getitem__(self, i):
+		if i < 0: i += self.size
+		if i < 0 or i >= self.size: raise IndexError('RingBuffer index out of range')
+		return self.data[(self.start + i) % self.capacity]
+
+	def append(self, item):
+		if self.size < self.capacity:
+			self.data[(self.start + self.size) % self.capacity] = item
+			self.size += 1
+		else:
+			self.data[self.start] = item
+			self.start = (self.start + 1) % self.capacity
+
+	def bisect(self, t):
+		"""Return the index of the first entry with timestamp >= ``t``."""
+		lo, hi = 0, self.size
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self[mid][0] < t: lo = mid + 1
+			else: hi = mid
+		return lo
+
+	def oldest(self):
+		"""Return the timestamp of the oldest entry or None if empty."""
+		return self[0][0] if self.size > 0 else None
+
+	def window(self, t0, t1):
+		"""Return the list of entries with timestamps in [t0, t1]."""
+		i0 = self.bisect(t0)
+		i1 = self.bisect(t1)
+		while i1 < self.size and self[i1][0] <= t1: i1 += 1
+		return [self[i] for i in range(i0, i1)]
+
+class Tier:
+	"""One decimated resolution of a series. The samples are collected into
+	the open bucket, which is closed into the ring buffer as
+	``(t, min, max, mean)`` once a sample of a later bucket arrives.
+	"""
+	def __init__(self, width, capacity):
+		self.width = width
+		self.buckets = RingBuffer(capacity)
+		self.current = None # [start, min, max, sum, count]
+
+	def add(self, t, value):
+		start = t - (t % self.width)
+		cur = self.current
+		if cur is not None and cur[0] == start:
+			if value < cur[1]: cur[1] = value
+			if value > cur[2]: cur[2] = value
+			cur[3] += value
+			cur[4] += 1
+			return
+		if cur is not None:
+			self.buckets.append( (cur[0], cur[1], cur[2], cur[3]/cur[4]) )
+		self.current = [start, value, value, value, 1]
+
+	def oldest(self):
+		t = self.buckets.oldest()
+		if t is None and self.current is not None: t = self.current[0]
+		return t
+
+	def window(self, t0, t1):
+		# include buckets that overlap the start of the window
+		points = self.buckets.window(t0 - self.width, t1)
+		if points and points[0][0] + self.width <= t0: points.pop(0)
+		cur = self.current
+		if cur is not None and cur[0] <= t1 and cur[0] + self.width > t0:
+			points.append( (cur[0], cur[1], cur[2], cur[3]/cur[4]) )
+		return points
+
+class Series:
+	"""History of one quantity of one channel at all resolutions."""
+	def __init__(self, raw_capacity=RAW_CAPACITY, tiers=TIERS):
+		self.raw = RingBuffer(raw_capacity)
+		self.tiers = [Tier(width, capacity) for width, capacity in tiers]
+		self.first = None
+		self.last = None
+
+	def add(self, t, value):
+		if self.last is not None and t < self.last: return # out of order sample
+		if self.first is None: self.first = t
+		self.last = t
+		self.raw.append( (t, value) )
+		if not math.isfinite(value): return # kept only in the raw samples
+		for tier in self.tiers:
+			tier.add(t, value)
+
+	def query(self, t0, t1, max_points):
+		"""Return the points in [t0, t1] as a list of ``(t, min, max, mean)``
+		tuples from the finest resolution that covers the window with at
+		most ``max_points`` points. Raw samples have min = max = mean.
+		A resolution covers the window if it still holds all of its samples
+		since ``t0`` or since the first sample of the series.
+		"""
+		if self.first is None: return []
+		start = max(t0, self.first)
+
+		oldest = self.raw.oldest()
+		if oldest is not None and oldest <= start:
+			i0 = self.raw.bisect(t0)
+			i1 = self.raw.bisect(t1)
+			if i1 - i0 <= max_points:
+				return [(t, v, v, v) for t, v in self.raw.window(t0, t1)]
+
+		for tier in self.tiers:
+			oldest = tier.oldest()
+			if oldest is None: break
+			if (t1 - start) / tier.width <= max_points and oldest <= start:
+				return tier.window(t0, t1)
+
+		# Nothing covers the whole window, merge the buckets of the coarsest tier
+		if self.tiers: points = self.tiers[-1].window(t0, t1)
+		else: points = [(t, v, v, v) for t, v in self.raw.window(t0, t1)]
+		return merge(points, max_points)
+
+def merge(points, max_points):
+	"""Merge groups of consecutive ``(t, min, max, mean)`` points so that
+	at most ``max_points`` points are left.
+	"""
+	if len(points) <= max_points or max_points < 1: return points
+	n = -(-len(points) // max_points) # points per group, rounded up
+	merged = []
+	for i in range(0, len(points), n):
+		group = points[i:i+n]
+		merged.append( (group[0][0], min(p[1] for p in group), max(p[2] for p in group),
+			sum(p[3] for p in group) / len(group)) )
+	return merged
+
+class History:
+	"""Thread-safe history store for the readings of several MHV-4 units.
+	The series are identified by the unit serial number, channel number
+	and quantity name.
+	"""
+	def __init__(self, raw_capacity=RAW_CAPACITY, tiers=TIERS):
+		self.raw_capacity = raw_capacity
+		self.tiers = sorted(tiers)
+		self.series = {}
+		self.lock = threading.Lock()
+
+	def add(self, serial, channel, quantity, value, t=None):
+		"""Add one reading ``value`` of the ``quantity`` of the given unit
+		``serial`` and ``channel`` at the time ``t`` (default: now).
+		Non-numeric values are ignored, NaN and infinite values are kept
+		only in the raw samples and left out of the decimated tiers.
+		"""
+		if isinstance(value, bool) or not isinstance(value, numbers.Real): return
+		if t is None: t = time.time()
+		key = (serial, channel, quantity)
+		with self.lock:
+			series = self.series.get(key)
+			if series is None:
+				series = self.series[key] = Series(self.raw_capacity, self.tiers)
+			series.add(t, value)
+
+	def record(self, unit, t=None):
+		"""Add the latest voltage and current values of all channels of a
+		unit, e.g. the ``Unit`` of the GUI example after ``updateValues()``.
+		"""
+		if t is None: t = time.time()
+		for ch in unit.channels:
+			self.add(unit.serial, ch.channel, 'voltage', ch.voltage, t)
+			self.add(unit.serial, ch.channel, 'current', ch.current, t)
+
+	def query(self, serial, channel, quantity, t0=None, t1=None, max_points=1000):
+		"""Return the history of the given series in the time window [t0, t1]
+		as a list of ``(t, min, max, mean)`` tuples with at most about
+		``max_points`` points. The window defaults to the whole history.
+		"""
+		key = (serial, channel, quantity)
+		with self.lock:
+			series = self.series.get(key)
+			if series is None: return []
+			if t0 is None: t0 = series.first
+			if t1 is None: t1 = series.last
+			return series.query(t0, t1, max_points)
+
+	def keys(self):
+		"""Return the list of ``(serial, channel, quantity)`` series stored."""
+		with self.lock:
+			return list(self.series.keys())
@@ -10,10 +10,12 @@ __author__ = "Joonas Konki"
 __license__ = "MIT, see LICENSE for more details"
 __copyright__ = "2018 Joonas Konki"
 
+import os
+import sys
 import serial
 import time
 import re
-from lockfile import LockFile
+from lockfile import LockFile, LockTimeout
 
 VOLTAGE_LIMIT = 100
 LOCK_TIMEOUT = 5
@@ -21,22 +23,25 @@ LOCK_PATH = '/tmp/'
 
 class MHV4():
 	def __init__(self,port,baud):
-		lockfile = '.mhv4lib.'+port[4:]+'.lock'
-		self.lock = LockFile(LOCK_PATH + lock_file)
+		lockfile = '.mhv4lib.'+os.path.basename(port)+'.lock'
+		self.lock = LockFile(LOCK_PATH + lockfile)
 		try:
 			self.lock.acquire(timeout=LOCK_TIMEOUT)
-			if lock.is_locked():
-				print('Lockfile acquired successfully: ' + LOCK_PATH + lockfile )
-				self.port = port
-				self.ser = serial.Serial( port=self.port, baudrate=baud, timeout=1 )
-				time.sleep(0.1) # Wait 100 ms after opening the port before sending commands
-				self.ser.flushInput() # Flush the input buffer of the serial port before sending any new commands
-				time.sleep(0.1)
 		except LockTimeout:
-			print('Lockfile could not be acquired for port ' + port)
-			print('Is there another program using mhv4lib ??')
-
+			print('Lockfile could not be acquired for port ' + port, file=sys.stderr)
+			print('Is there another program using mhv4lib ??', file=sys.stderr)
+			raise
 
+		print('Lockfile acquired successfully: ' + LOCK_PATH + lockfile, file=sys.stderr)
+		self.port = port
+		try:
+			self.ser = serial.Serial( port=self.port, baudrate=baud, timeout=1 )
+		except Exception:
+			self.lock.release()
+			raise
+		time.sleep(0.1) # Wait 100 ms after opening the port before sending commands
+		self.ser.flushInput() # Flush the input buffer of the serial port before sending any new commands
+		time.sleep(0.1)
 
 	def close(self):
 		"""The function closes and releases the serial port connection attached to the unit.
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Deadband change-detection publisher for polled readings of Mesytec MHV-4 units.
+
+The polled values are passed to a ``Publisher``, which forwards a value to
+its subscribers only if it differs from the last published value of the same
+unit, channel and quantity by more than the deadband of the quantity, or if
+nothing has been published for the heartbeat interval. The subscribers are
+called as ``callback(serial, channel, quantity, value, t)``, so e.g.
+``History.add`` of mhv4history can be subscribed directly.
+"""
+__author__ = "Joonas Konki"
+__license__ = "MIT, see LICENSE for more details"
+__copyright__ = "2018 Joonas Konki"
+
+import sys
+import time
+import threading
+
+# Default deadbands as quantity -> (absolute, relative). A change is published
+# if it is larger than max(absolute, relative * |last published value|).
+DEADBANDS = { 'voltage': (0.1, 0.001), 'current': (0.001, 0.01) }
+HEARTBEAT = 60 # s, publish unchanged values at least this often
+
+class Publisher:
+	"""Publish/subscribe layer that filters polled readings with per-quantity
+	deadbands and a heartbeat interval. Quantities without a deadband, e.g.
+	'enabled' or 'polarity', are published on any change. A reading that
+	becomes or stops being NaN is always a change.
+	"""
+	def __init__(self, deadbands=None, heartbeat=HEARTBEAT):
+		self.deadbands = dict(DEADBANDS if deadbands is None else deadbands)
+		self.heartbeat = heartbeat
+		self.subscribers = []
+		self.last = {} # (serial, channel, quantity) -> (value, t)
+		self.lock = threading.Lock()
+
+	def subscribe(self, callback):
+		"""Add a subscriber ``callback(serial, channel, quantity, value, t)``."""
+		with self.lock:
+			if callback not in self.subscribers:
+				self.subscribers.append(callback)
+
+	def unsubscribe(self, callback):
+		"""Remove a subscriber added with ``subscribe()``."""
+		with self.lock:
+			if callback in self.subscribers:
+				self.subscribers.remove(callback)
+
+	def set_deadband(self, quantity, absolute=0., relative=0.):
+		"""Set the absolute and relative deadband of the ``quantity``."""
+		with self.lock:
+			self.deadbands[quantity] = (absolute, relative)
+
+	def changed(self, key, value, t):
+		"""Return True if ``value`` at time ``t`` should be published for ``key``."""
+		last = self.last.get(key)
+		if last is None: return True
+		lastvalue, lastt = last
+		if self.heartbeat is not None and t - lastt >= self.heartbeat: return True
+		deadband = self.deadbands.get(key[2])
+		if value != value or lastvalue != lastvalue: # NaN
+			return (value != value) != (lastvalue != lastvalue)
+		if deadband is None: return value != lastvalue
+		absolute, relative = deadband
+		return abs(value - lastvalue) > max(absolute, relative * abs(lastvalue))
+
+	def update(self, serial, channel, quantity, value, t=None):
+		"""Pass one polled ``value`` to the publisher. Returns True if the
+		value was published to the subscribers.
+		"""
+		if t is None: t = time.time()
+		key = (serial, channel, quantity)
+		with self.lock:
+			if not self.changed(key, value, t): return False
+			self.last[key] = (value, t)
+			subscribers = list(self.subscribers)
+
+		for callback in subscribers:
+			try:
+				callback(serial, channel, quantity, value, t)
+			except Exception as e:
+				print('Subscriber %r failed: %s' % (callback, e), file=sys.stderr)
+		return True
+
+	def publish_unit(self, unit, t=None):
+		"""Pass the latest values of all channels of a unit, e.g. the ``Unit``
+		of the GUI example after ``updateValues()``, to the publisher.
+		"""
+		if t is None: t = time.time()
+		for ch in unit.channels:
+			self.update(unit.serial, ch.channel, 'voltage', ch.voltage, t)
+			self.update(unit.serial, ch.channel, 'current', ch.current, t)
+			self.update(unit.serial, ch.channel, 'enabled', ch.enabled, t)
+			self.update(unit.serial, ch.channel, 'polarity', ch.polarity, t)
+
+	def reset(self, serial=None):
+		"""Forget the last published values, of one unit or of all units, so
+		that the next values are published regardless of the deadbands.
+		"""
+		with self.lock:
+			if serial is None:
+				self.last.clear()
+			else:
+				for key in [k for k in self.last if k[0] == serial]:
+					del self.last[key]
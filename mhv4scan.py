@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch analysis of I-V scan files written by example2_cd_leakage_current_scan.py.
+
+Each scan file has the voltage in the first column and the leakage current
+of one channel (detector quadrant) in each of the following columns. Many
+scans are loaded into one stacked array of shape
+``(n_scans, n_points, 1 + n_channels)``, where shorter scans are padded with
+NaN, and all of the analysis functions work on the whole stack at once.
+
+A loaded campaign can be saved with ``save_stack()`` and loaded back
+memory-mapped with ``load_stack()``, so it does not have to be parsed again.
+
+Requires numpy.
+"""
+__author__ = "Joonas Konki"
+__license__ = "MIT, see LICENSE for more details"
+__copyright__ = "2018 Joonas Konki"
+
+import sys
+import argparse
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+def load_scan(path):
+	"""The function loads one scan file and returns it as a 2D array
+	with the voltage in column 0 and the currents in the other columns.
+	"""
+	return np.loadtxt(path, ndmin=2)
+
+def load_scans(paths, processes=None):
+	"""The function loads many scan files into one stacked array of shape
+	``(n_scans, n_points, n_columns)``. Scans with fewer points are padded
+	with NaN at the end.
+
+	:param paths: The list of scan files.
+	:param processes: If given, the files are parsed in a pool of this many
+	                  processes (0 uses the number of CPUs).
+	"""
+	paths = list(paths)
+	if processes is None:
+		scans = [load_scan(p) for p in paths]
+	else:
+		with ProcessPoolExecutor(max_workers=processes or None) as pool:
+			scans = list(pool.map(load_scan, paths, chunksize=max(1, len(paths) // 64)))
+
+	if len(scans) == 0: return np.empty((0, 0, 0))
+	npoints = max(s.shape[0] for s in scans)
+	ncolumns = max(s.shape[1] for s in scans)
+	stack = np.full((len(scans), npoints, ncolumns), np.nan)
+	for i, s in enumerate(scans):
+		stack[i, :s.shape[0], :s.shape[1]] = s
+	return stack
+
+def save_stack(path, stack):
+	"""The function saves a stacked array as a .npy file."""
+	np.save(path, stack)
+
+def load_stack(path, mmap=True):
+	"""The function loads a stacked array saved with ``save_stack()``,
+	memory-mapped read-only by default.
+	"""
+	return np.load(path, mmap_mode='r' if mmap else None)
+
+def split(stack):
+	"""The function returns the voltages ``(n_scans, n_points)`` and the
+	currents ``(n_scans, n_points, n_channels)`` of a stacked array.
+	"""
+	return stack[:, :, 0], stack[:, :, 1:]
+
+def leakage_at(stack, voltages):
+	"""The function returns the leakage currents of all scans and channels
+	linearly interpolated at the given reference voltages, as an array of
+	shape ``(n_scans, n_voltages, n_channels)``. Voltages outside of the
+	scanned range give NaN. The scan voltages must be increasing.
+
+	:param stack: The stacked scans.
+	:param voltages: The list of reference voltages in V.
+	"""
+	V, I = split(stack)
+	ref = np.atleast_1d(np.asarray(voltages, dtype=float))
+	npoints = V.shape[1]
+	if npoints < 2:
+		return np.full((V.shape[0], ref.size, I.shape[2]), np.nan)
+
+	# index of the first scan point at or above each reference voltage
+	idx = np.clip((V[:, :, None] < ref[None, None, :]).sum(axis=1), 1, npoints - 1)
+	v0 = np.take_along_axis(V, idx - 1, axis=1)
+	v1 = np.take_along_axis(V, idx, axis=1)
+	i0 = np.take_along_axis(I, (idx - 1)[:, :, None], axis=1)
+	i1 = np.take_along_axis(I, idx[:, :, None], axis=1)
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+		w = np.where(v1 > v0, (ref[None, :] - v0) / (v1 - v0), 0.)
+	inside = (ref[None, :] >= v0) & (ref[None, :] <= v1)
+	w = np.where(inside, w, np.nan)[:, :, None]
+	return i0 + w * (i1 - i0)
+
+def ohmic_fit(stack, vmax=None):
+	"""The function fits a straight line I = a + b*V to every channel of
+	every scan, using the points up to ``vmax`` (default: all points).
+	Returns ``(intercept, slope, rms)`` each of shape ``(n_scans, n_channels)``,
+	where ``rms`` is the root mean square of the fit residuals. The
+	slope is the ohmic conductance in units of the current per V.
+	"""
+	V, I = split(stack)
+	mask = np.isfinite(V)[:, :, None] & np.isfinite(I)
+	if vmax is not None:
+		mask &= (V <= vmax)[:, :, None]
+
+	x = np.where(mask, V[:, :, None], 0.)
+	y = np.where(mask, I, 0.)
+	n = mask.sum(axis=1)
+	sx, sy = x.sum(axis=1), y.sum(axis=1)
+	sxx, sxy = (x*x).sum(axis=1), (x*y).sum(axis=1)
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+		slope = (n*sxy - sx*sy) / (n*sxx - sx*sx)
+		intercept = (sy - slope*sx) / n
+		residuals = np.where(mask, y - intercept[:, None, :] - slope[:, None, :]*x, 0.)
+		rms = np.sqrt((residuals**2).sum(axis=1) / n)
+	slope = np.where(n >= 2, slope, np.nan)
+	intercept = np.where(n >= 2, intercept, np.nan)
+	rms = np.where(n >= 3, rms, np.nan)
+	return intercept, slope, rms
+
+def breakdown_voltage(stack, factor=5., nbaseline=5, resolution=0.001, npersist=2):
+	"""The function returns the breakdown (knee) voltage of every channel of
+	every scan, as an array of shape ``(n_scans, n_channels)``. The knee is
+	the first voltage where the differential conductance dI/dV exceeds
+	``factor`` times the baseline conductance for at least ``npersist``
+	consecutive steps. The baseline is the median conductance of the first
+	``nbaseline`` steps of the scan, but at least ``resolution`` (the
+	resolution of the currents, 1 nA in the example 2 files) over the
+	median voltage step, so that rounding steps of the currents are not
+	taken as a knee. The currents of each channel are flipped to the sign of
+	its leakage current first, so negative polarity works the same way.
+	Channels without a knee give NaN.
+	"""
+	V, I = split(stack)
+	if V.shape[1] < 2:
+		return np.full((V.shape[0], I.shape[2]), np.nan)
+
+	dV = np.diff(V, axis=1)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		slopes = np.diff(I, axis=1) / dV[:, :, None]
+	nbaseline = max(1, min(nbaseline, slopes.shape[1]))
+	npersist = max(1, npersist)
+	with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+		warnings.simplefilter('ignore', RuntimeWarning) # all-NaN padded channels
+		sign = np.where(np.nanmedian(I, axis=1) < 0, -1., 1.)
+		slopes = slopes * sign[:, None, :]
+		floor = resolution / np.nanmedian(dV, axis=1)
+		baseline = np.abs(np.nanmedian(slopes[:, :nbaseline, :], axis=1))
+		baseline = np.fmax(baseline, floor[:, None])
+		above = slopes > factor * baseline[:, None, :]
+	above[:, :nbaseline, :] = False
+
+	# the excess has to persist for npersist consecutive steps
+	nsteps = above.shape[1] - npersist + 1
+	if nsteps < 1:
+		return np.full((V.shape[0], I.shape[2]), np.nan)
+	knee = above[:, :nsteps, :].copy()
+	for i in range(1, npersist):
+		knee &= above[:, i:i+nsteps, :]
+
+	first = knee.argmax(axis=1)
+	voltage = np.take_along_axis(V, first, axis=1)
+	return np.where(knee.any(axis=1), voltage, np.nan)
+
+def drift(stack, detectors, voltages):
+	"""The function returns the change of the leakage currents at the
+	reference ``voltages`` of every scan relative to the first scan of the
+	same detector, as an array of shape ``(n_scans, n_voltages, n_channels)``.
+
+	:param stack: The stacked scans, in chronological order.
+	:param detectors: The detector identifier of each scan.
+	:param voltages: The list of reference voltages in V.
+	"""
+	leakage = leakage_at(stack, voltages)
+	detectors = np.asarray(detectors)
+	_, first, inverse = np.unique(detectors, return_index=True, return_inverse=True)
+	return leakage - leakage[first[inverse.ravel()]]
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		description='Analyse I-V scan files written by example2_cd_leakage_current_scan.py.')
+	parser.add_argument('files', nargs='+', help='scan files')
+	parser.add_argument('-v', '--voltage', type=float, action='append',
+		help='reference voltage in V for the leakage currents (repeatable, default: 10)')
+	parser.add_argument('-j', '--processes', type=int, default=None,
+		help='parse the files in a pool of this many processes (0: number of CPUs)')
+	opts = parser.parse_args(argv)
+
+	voltages = opts.voltage or [10.]
+	stack = load_scans(opts.files, opts.processes)
+	leakage = leakage_at(stack, voltages)
+	knee = breakdown_voltage(stack)
+	intercept, slope, rms = ohmic_fit(stack)
+
+	for i, path in enumerate(opts.files):
+		print(path)
+		for ch in range(leakage.shape[2]):
+			currents = ' '.join('I(%.1f V)=%.4f' % (v, c) for v, c in zip(voltages, leakage[i, :, ch]))
+			print('  ch %d: %s knee=%.1f V slope=%.4g rms=%.4g'
+				% (ch, currents, knee[i, ch], slope[i, ch], rms[i, ch]))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
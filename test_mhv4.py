@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import pytest
+
+import mhv4
+import mhv4lib
+
+class FakeMHV4:
+	"""Fake unit whose ON channels follow the preset up to ``limit`` Volts."""
+	def __init__(self, port=None, baud=9600, on=True, limit=100):
+		self.preset = [0.]*4
+		self.on = [on]*4
+		self.limit = limit
+		self.calls = 0
+		self.closed = False
+
+	def set_voltage(self, channel, voltage):
+		self.calls += 1
+		assert self.calls < 1000, 'ramp does not terminate'
+		self.preset[channel] = voltage
+
+	def get_voltage_preset(self, channel):
+		return self.preset[channel]
+
+	def get_voltage(self, channel):
+		return min(self.preset[channel], self.limit) if self.on[channel] else 0.
+
+	def get_current(self, channel):
+		return 0.01
+
+	def set_on(self, channel):
+		self.on[channel] = True
+
+	def set_off(self, channel):
+		self.on[channel] = False
+
+	def close(self):
+		self.closed = True
+
+def test_ramp_on_channel():
+	unit = FakeMHV4()
+	assert mhv4.ramp_voltage(unit, 0, 5.5, step=1, wait=0) == 5.5
+	assert unit.calls == 6
+
+def test_ramp_off_channel_terminates():
+	unit = FakeMHV4(on=False)
+	assert mhv4.ramp_voltage(unit, 2, 30, step=1, wait=0) == 0.
+	assert unit.preset[2] == 30
+
+def test_ramp_starts_from_measured_voltage():
+	unit = FakeMHV4()
+	unit.preset[1] = 80.
+	unit.get_voltage_preset = lambda channel: 0. # older firmware
+	mhv4.ramp_voltage(unit, 1, 90, step=1, wait=0)
+	assert unit.calls == 10 # 81, 82, ..., 90 and never down to 1 V
+
+def test_ramp_stopped_by_limit_raises():
+	unit = FakeMHV4(limit=10)
+	with pytest.raises(mhv4.BatchError):
+		mhv4.ramp_voltage(unit, 0, 30, step=1, wait=0)
+
+def test_ramp_rejects_bad_step():
+	with pytest.raises(mhv4.BatchError):
+		mhv4.ramp_voltage(FakeMHV4(), 0, 30, step=0, wait=0)
+
+def test_parse_line():
+	assert mhv4.parse_line('0318132 set 0 25 # comment') == ('0318132', 'set', 0, [25.])
+	assert mhv4.parse_line('  # comment') is None
+	for line in ['x set 0 -50', 'x ramp 1 -1', 'x ramp 4 10', 'x bad 0', 'x set 0']:
+		with pytest.raises(mhv4.BatchError):
+			mhv4.parse_line(line)
+
+def test_run_operation_rejects_negative_voltage():
+	with pytest.raises(mhv4.BatchError):
+		mhv4.run_operation(FakeMHV4(), 'set', 0, [-50.])
+
+def run_batch(monkeypatch, batch, ports={ 'A': 'portA' }, **kwargs):
+	units = {}
+	def connect(port, baud):
+		units[port] = FakeMHV4(on=False, limit=10)
+		return units[port]
+	monkeypatch.setattr(mhv4lib, 'MHV4', connect)
+	monkeypatch.setattr(mhv4, 'find_ports', lambda serials: ports)
+	stream = io.StringIO()
+	output = mhv4.Output(stream)
+	mhv4.run_batch(io.StringIO(batch), output, step=1, wait=0, **kwargs)
+	results = [json.loads(line) for line in stream.getvalue().splitlines()]
+	return units, output, dict((r['line'], r) for r in results)
+
+def test_run_batch(monkeypatch):
+	units, output, results = run_batch(monkeypatch, 'A set 0 5\nA on 0\nA read 0\n')
+	assert results[3]['voltage'] == 5.
+	assert not output.failed
+	assert units['portA'].closed
+
+def test_run_batch_invalid_line_runs_nothing(monkeypatch):
+	units, output, results = run_batch(monkeypatch, 'A ramp 0 3O\nA on 0\n')
+	assert units == {}
+	assert list(results) == [1] and 'error' in results[1]
+	assert output.failed
+
+def test_run_batch_missing_unit_runs_nothing(monkeypatch):
+	units, output, results = run_batch(monkeypatch, 'A on 0\nB on 1\n')
+	assert units == {}
+	assert list(results) == [2] and 'error' in results[2]
+
+def test_run_batch_stops_unit_after_error(monkeypatch):
+	batch = 'A on 0\nA ramp 0 30\nA on 1\n'
+	units, output, results = run_batch(monkeypatch, batch)
+	assert 'error' in results[2] and 'skipped' in results[3]['error']
+	assert units['portA'].on[1] is False
+
+	units, output, results = run_batch(monkeypatch, batch, keep_going=True)
+	assert 'error' in results[2] and 'error' not in results[3]
+	assert units['portA'].on[1] is True
+
+def test_mhv4lib_connect(monkeypatch, tmp_path, capsys):
+	class FakeSerial:
+		def __init__(self, port, baudrate, timeout):
+			self.port = port
+		def flushInput(self):
+			pass
+		def close(self):
+			pass
+	monkeypatch.setattr(mhv4lib, 'LOCK_PATH', str(tmp_path) + '/')
+	monkeypatch.setattr(mhv4lib.serial, 'Serial', FakeSerial)
+	monkeypatch.setattr(mhv4lib.time, 'sleep', lambda s: None)
+	unit = mhv4lib.MHV4('/dev/ttyUSB0', baud=9600)
+	assert unit.lock.is_locked()
+	unit.close()
+	assert not unit.lock.is_locked()
+	assert capsys.readouterr().out == '' # keep stdout clean for mhv4.py
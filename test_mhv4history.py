@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import mhv4history
+
+def fill(history, seconds, dt=1, t0=0):
+	for i in range(0, seconds, dt):
+		history.add('A', 0, 'current', float(i % 100), t0 + i)
+
+def test_window_before_first_sample_uses_fine_tier():
+	history = mhv4history.History()
+	fill(history, 3600)
+	points = history.query('A', 0, 'current', 3599 - 7200, 3599, max_points=1000)
+	assert len(points) == 360 # 10 s buckets, not the 10 min ones
+	assert points[0][0] == 0 and points[-1][0] == 3590
+
+def test_whole_history_by_default():
+	history = mhv4history.History()
+	fill(history, 7200)
+	points = history.query('A', 0, 'current', max_points=1000)
+	assert len(points) == 720
+	assert (points[0][1], points[0][2], points[0][3]) == (0., 9., 4.5)
+
+def test_raw_samples_for_short_window():
+	history = mhv4history.History()
+	fill(history, 7200)
+	points = history.query('A', 0, 'current', 7000, 7199)
+	assert len(points) == 200
+	assert points[0] == (7000, 0., 0., 0.)
+
+def test_fallback_respects_max_points():
+	history = mhv4history.History(raw_capacity=10, tiers=[(10, 100)])
+	fill(history, 5000)
+	points = history.query('A', 0, 'current', 0, 4999, max_points=50)
+	assert 0 < len(points) <= 50
+	assert min(p[1] for p in points) == 0. and max(p[2] for p in points) == 99.
+
+def test_out_of_order_and_unknown_series():
+	history = mhv4history.History()
+	history.add('A', 0, 'voltage', 1., 10)
+	history.add('A', 0, 'voltage', 2., 5)
+	assert history.query('A', 0, 'voltage') == [(10, 1., 1., 1.)]
+	assert history.query('B', 0, 'voltage') == []
+
+def test_nan_and_non_numeric_values():
+	history = mhv4history.History(raw_capacity=5)
+	history.add('A', 0, 'current', float('nan'), 0)
+	history.add('A', 0, 'current', 'OFF', 1)
+	history.add('A', 0, 'current', None, 2)
+	for t in range(3, 20):
+		history.add('A', 0, 'current', float(t), t)
+	points = history.query('A', 0, 'current', 0, 19)
+	assert points == [(0, 3., 9., 6.), (10, 10., 19., 14.5)]
+
+	history = mhv4history.History()
+	history.add('A', 0, 'current', float('nan'), 0)
+	history.add('A', 0, 'current', 1., 1)
+	raw = history.query('A', 0, 'current')
+	assert raw[0][1] != raw[0][1] and raw[1] == (1, 1., 1., 1.) # NaN kept in raw
+	assert history.series[('A', 0, 'current')].tiers[0].window(0, 1) == [(0, 1., 1., 1.)]
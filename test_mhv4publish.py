@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import mhv4publish
+
+def publisher(**kwargs):
+	published = []
+	pub = mhv4publish.Publisher(**kwargs)
+	pub.subscribe(lambda serial, channel, quantity, value, t: published.append(value))
+	return pub, published
+
+def test_deadband_and_heartbeat():
+	pub, published = publisher(heartbeat=60)
+	for t, v in enumerate([10., 10.05, 10.2, 10.25, 10.25]):
+		pub.update('A', 0, 'voltage', v, t)
+	pub.update('A', 0, 'voltage', 10.25, 100)
+	assert published == [10., 10.2, 10.25]
+
+def test_nan_does_not_latch():
+	pub, published = publisher(heartbeat=None)
+	for t, v in enumerate([1., float('nan'), float('nan'), 5., 50.]):
+		pub.update('A', 0, 'current', v, t)
+	assert published[0] == 1. and published[1] != published[1]
+	assert published[2:] == [5., 50.]
+
+def test_quantities_without_deadband():
+	pub, published = publisher(heartbeat=None)
+	for t, v in enumerate(['+', '+', '-', '-']):
+		pub.update('A', 0, 'polarity', v, t)
+	for t, v in enumerate([0, 0, 1]):
+		pub.update('A', 0, 'enabled', v, t)
+	assert published == ['+', '-', 0, 1]
+
+def test_failing_subscriber(capsys):
+	pub, published = publisher()
+	pub.subscribe(lambda *args: 1/0)
+	assert pub.update('A', 0, 'voltage', 1., 0)
+	assert published == [1.]
+	captured = capsys.readouterr()
+	assert captured.out == '' and 'failed' in captured.err
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import mhv4scan
+
+VOLTAGES = np.arange(0.5, 30.5, 0.5) # as in example2_cd_leakage_current_scan.py
+
+def scan(currents):
+	"""Stack of one scan rounded like the example 2 output files."""
+	columns = [VOLTAGES] + [np.asarray(c, dtype=float) for c in currents]
+	return np.round(np.column_stack(columns), 3)[None, :, :]
+
+def test_no_knee_in_ohmic_scan():
+	stack = scan([0.0005*VOLTAGES, 0.002*VOLTAGES, 0.01*VOLTAGES, 0.*VOLTAGES])
+	assert np.isnan(mhv4scan.breakdown_voltage(stack)).all()
+
+def test_knee():
+	current = 0.001*VOLTAGES + np.where(VOLTAGES > 20, 0.05*(VOLTAGES - 20)**2, 0.)
+	knee = mhv4scan.breakdown_voltage(scan([current, -current]))
+	assert 20. <= knee[0, 0] <= 22.
+	assert knee[0, 1] == knee[0, 0] # negative polarity
+
+def test_single_spike_is_not_a_knee():
+	current = 0.01*VOLTAGES
+	current[30] += 0.2
+	assert np.isnan(mhv4scan.breakdown_voltage(scan([current]))).all()
+
+def test_leakage_ohmic_fit_and_drift():
+	stack = np.concatenate([scan([0.01*VOLTAGES]), scan([0.02*VOLTAGES + 0.1])])
+	leakage = mhv4scan.leakage_at(stack, [0.25, 10., 12.25, 40.])
+	assert np.isnan(leakage[:, [0, 3], :]).all()
+	assert np.allclose(leakage[:, 1:3, 0], [[0.1, 0.1225], [0.3, 0.345]], atol=1e-3)
+
+	intercept, slope, rms = mhv4scan.ohmic_fit(stack)
+	assert np.allclose(slope[:, 0], [0.01, 0.02], atol=1e-4)
+	assert np.allclose(intercept[:, 0], [0., 0.1], atol=1e-3)
+	assert (rms < 1e-3).all()
+
+	d = mhv4scan.drift(np.concatenate([stack, stack[:1]]), ['A', 'B', 'A'], [10.])
+	assert np.allclose(d[:, 0, 0], [0., 0., 0.])
+
+def test_load_scans(tmp_path):
+	paths = []
+	for n in [60, 40]:
+		path = tmp_path / ('scan%d.txt' % n)
+		np.savetxt(path, scan([0.01*VOLTAGES])[0, :n], fmt='%.3f', delimiter=' ')
+		paths.append(str(path))
+	stack = mhv4scan.load_scans(paths, processes=2)
+	assert stack.shape == (2, 60, 2)
+	assert np.isnan(stack[1, 40:]).all()
+
+	mhv4scan.save_stack(str(tmp_path / 'stack.npy'), stack)
+	mapped = mhv4scan.load_stack(str(tmp_path / 'stack.npy'))
+	assert isinstance(mapped, np.memmap)
+	assert np.allclose(mhv4scan.leakage_at(mapped, [10.]), mhv4scan.leakage_at(stack, [10.]))